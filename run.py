@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 # Optional: delegates to ./run to keep CLI in POSIX shell (BIDS Apps convention).
-import os, sys, subprocess, shlex
+# exec replaces this interpreter with ./run instead of forking and waiting on it.
+import os, sys
 cmd = ["/usr/local/bin/run"] + sys.argv[1:]
-sys.exit(subprocess.call(cmd))
\ No newline at end of file
+os.execvp(cmd[0], cmd)
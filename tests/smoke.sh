@@ -38,10 +38,10 @@ run_test() {
     
     if eval "$test_command"; then
         echo -e "${GREEN}✅ PASSED: $test_name${NC}"
-        ((TESTS_PASSED++))
+        TESTS_PASSED=$((TESTS_PASSED + 1))
     else
         echo -e "${RED}❌ FAILED: $test_name${NC}"
-        ((TESTS_FAILED++))
+        TESTS_FAILED=$((TESTS_FAILED + 1))
     fi
 }
 
@@ -76,6 +76,17 @@ if [[ ! -d "$TEST_DATA_DIR" ]]; then
     "
 fi
 
+# Test 3b: Generate a packed synthetic dataset
+PACK_DIR="$OUTPUT_DIR/packed_meg"
+run_test "Generate packed synthetic test data" "
+    cd '$PROJECT_ROOT' &&
+    mkdir -p '$OUTPUT_DIR' &&
+    python3 tools/gen_synth_meg.py '$PACK_DIR' --n-participants 1 --include-anat --pack-tar > /dev/null &&
+    tar -tf '$PACK_DIR.tar' | grep -q '^packed_meg/dataset_description.json$' &&
+    tar -tf '$PACK_DIR.tar' | grep -q '^packed_meg/sub-01/meg/sub-01_task-rest_run-01_meg.fif$' &&
+    tar -tf '$PACK_DIR.tar' | grep -q '^packed_meg/sub-01/anat/sub-01_T1w.nii.gz$'
+"
+
 # Test 4: Validate test data structure
 run_test "Test data has valid BIDS structure" "
     [[ -f '$TEST_DATA_DIR/dataset_description.json' ]] &&